@@ -2,69 +2,104 @@
 """Batch IGC to KMZ converter for paragliding tracklogs."""
 
 import colorsys
+import datetime
+import functools
+import io
 import os
+import re
 import subprocess
 import sys
+import time
 import zipfile
-import xml.etree.ElementTree as ET
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from operator import attrgetter
+from xml.sax.saxutils import escape
+
+# lxml's C serializer and parser are used when available; the stdlib API is the fallback
+try:
+    from lxml import etree as ET
+
+    _HAVE_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+    _HAVE_LXML = False
+
+# B-record: BHHMMSSDDMMmmmNDDDMMmmmEVPPPPPGGGGG, valid ("A") fixes only. Records must start
+# at the beginning of a line and use zero-padded numeric fields, as the IGC spec requires.
+_B_RECORD_RE = re.compile(
+    rb"^B\d{6}(\d{7})([NS])(\d{8})([EW])A([-\d]\d{4})([-\d]\d{4})",
+    re.MULTILINE,
+)
+
+# H-records we read: date (HFDTE/HPDTE DDMMYY, optionally "DATE:" prefixed) and pilot (HxPLT...:name).
+# The record letter must be an uppercase "H" (parse_igc only visits lines starting with it);
+# the subtype and field names after it are matched case-insensitively.
+_H_RECORD_RE = re.compile(
+    rb"^H(?i:[FP]DTE[^\d\r\n]*(?P<date>\d{6})|.PLT[^:\r\n]*:(?P<pilot>[^\r\n]*))",
+    re.MULTILINE,
+)
+
+# KML "lon,lat,alt" triplet; 6 decimals is ~0.1 m, finer than IGC's 0.001' resolution
+_COORD_FMT = "%.6f,%.6f,%d"
+
+
+@functools.lru_cache(maxsize=512)
+def _parse_hfdte(digits):
+    """Convert a DDMMYY date string to 'YYYY-MM-DD', or None if not a real date."""
+    year = int(digits[4:6])
+    # Same pivot as strptime's %y: 69-99 -> 19xx, 00-68 -> 20xx
+    year += 1900 if year >= 69 else 2000
+    try:
+        return datetime.date(year, int(digits[2:4]), int(digits[0:2])).isoformat()
+    except ValueError:
+        return None
 
 
 def parse_igc(filepath):
     """Parse an IGC file and return metadata + tracklog points."""
-    points = []
     pilot = None
     date = None
 
-    with open(filepath, "r", errors="replace") as f:
-        for line in f:
-            line = line.strip()
-
-            # H-records: metadata
-            if line.startswith("H"):
-                upper = line.upper()
-                # Pilot name
-                if "PLT" in upper and ":" in line:
-                    pilot = line.split(":", 1)[1].strip() or None
-                # Date (HFDTE or HPDTE): DDMMYY
-                if upper.startswith("HFDTE") or upper.startswith("HPDTE"):
-                    digits = "".join(c for c in line[5:] if c.isdigit())
-                    if len(digits) >= 6:
-                        try:
-                            date = datetime.strptime(digits[:6], "%d%m%y").strftime("%Y-%m-%d")
-                        except ValueError:
-                            pass
-
-            # B-records: fixes
-            # BHHMMSSDDMMmmmNDDDMMmmmEVPPPPPGGGGG
-            if line.startswith("B") and len(line) >= 35:
-                validity = line[24]
-                if validity != "A":
-                    continue
+    # Read the whole log at once; tracklogs are typically a few hundred KB to a few MB
+    with open(filepath, "rb") as f:
+        data = f.read()
+    # Regexes anchor on "\n"; also accept old Mac CR-only line endings
+    data = data.replace(b"\r", b"\n")
 
-                try:
-                    # Latitude: DDMMmmm
-                    lat_deg = int(line[7:9])
-                    lat_min = int(line[9:14]) / 1000.0
-                    lat = lat_deg + lat_min / 60.0
-                    if line[14] == "S":
-                        lat = -lat
-
-                    # Longitude: DDDMMmmm
-                    lon_deg = int(line[15:18])
-                    lon_min = int(line[18:23]) / 1000.0
-                    lon = lon_deg + lon_min / 60.0
-                    if line[23] == "W":
-                        lon = -lon
-
-                    # Altitude: GPS preferred (cols 30-35), pressure fallback (25-30)
-                    gps_alt = int(line[30:35])
-                    press_alt = int(line[25:30])
-                    alt = gps_alt if gps_alt > 0 else press_alt
-
-                    points.append((lat, lon, alt))
-                except (ValueError, IndexError):
-                    continue
+    # H-records: metadata. Jump from one "\nH" line start to the next with bytes.find (line
+    # endings are already normalised to "\n"), so the B/G/K/L/... records that make up most
+    # of a log never reach the Python loop.
+    pos = -1
+    while True:
+        m = _H_RECORD_RE.match(data, pos + 1)
+        if m is not None:
+            if m.lastgroup == "pilot":
+                pilot = m["pilot"].strip().decode("utf-8", errors="replace") or None
+            else:
+                date = _parse_hfdte(m["date"].decode("ascii")) or date
+        pos = data.find(b"\nH", pos + 1)
+        if pos < 0:
+            break
+
+    # B-records: fixes, matched and split into fields in a single regex pass. Each decoded
+    # fix overwrites its raw field tuple in place, so the list is never regrown and each
+    # record's bytes are freed as soon as its fix is stored.
+    points = _B_RECORD_RE.findall(data)
+    for i, (lat_field, ns, lon_field, ew, press_alt, gps_alt) in enumerate(points):
+        # DDMMmmm / DDDMMmmm: one int() per field, degrees and milli-minutes split by divmod
+        lat_deg, lat_min = divmod(int(lat_field), 100_000)
+        lat = lat_deg + lat_min / 1000.0 / 60.0
+        if ns == b"S":
+            lat = -lat
+        lon_deg, lon_min = divmod(int(lon_field), 100_000)
+        lon = lon_deg + lon_min / 1000.0 / 60.0
+        if ew == b"W":
+            lon = -lon
+        # Altitude: GPS preferred, pressure fallback
+        gps_alt = int(gps_alt)
+        alt = gps_alt if gps_alt > 0 else int(press_alt)
+        points[i] = (lat, lon, alt)
 
     return {"pilot": pilot, "date": date, "points": points}
 
@@ -128,75 +163,98 @@ def simplify_track(points, tolerance_m):
     return _rdp(points)
 
 
+def format_coords(points):
+    """Format (lat, lon, alt) points as a KML coordinates string ("lon,lat,alt lon,lat,alt ...")."""
+    return " ".join([_COORD_FMT % (lon, lat, alt) for lat, lon, alt in points])
+
+
+@functools.lru_cache(maxsize=None)
+def _style_block(color_kml):
+    """Return the track/pin <Style> elements for a color; shared by every file of that color."""
+    return (
+        f'<Style id="trackStyle"><LineStyle><color>{color_kml}</color><width>3</width></LineStyle></Style>'
+        '<Style id="pinStyle"><IconStyle><scale>1.0</scale></IconStyle></Style>'
+    )
+
+
 def build_kml(track_data, name, color_kml):
-    """Build KML XML for a single flight track."""
-    kml = ET.Element("kml", xmlns="http://www.opengis.net/kml/2.2")
-    doc = ET.SubElement(kml, "Document")
-    ET.SubElement(doc, "name").text = name
+    """Build the KML document for a single flight track as a list of text chunks."""
+    name = escape(name)
+    parts = [f'<kml xmlns="http://www.opengis.net/kml/2.2"><Document><name>{name}</name>']
 
     # Description
-    parts = []
+    desc = []
     if track_data["pilot"]:
-        parts.append(f"Pilot: {track_data['pilot']}")
+        desc.append(f"Pilot: {track_data['pilot']}")
     if track_data["date"]:
-        parts.append(f"Date: {track_data['date']}")
-    if parts:
-        ET.SubElement(doc, "description").text = "\n".join(parts)
-
-    # Line style
-    style = ET.SubElement(doc, "Style", id="trackStyle")
-    line_style = ET.SubElement(style, "LineStyle")
-    ET.SubElement(line_style, "color").text = color_kml
-    ET.SubElement(line_style, "width").text = "3"
+        desc.append(f"Date: {track_data['date']}")
+    if desc:
+        description = escape("\n".join(desc))
+        parts.append(f"<description>{description}</description>")
 
-    # Pin style
-    pin_style = ET.SubElement(doc, "Style", id="pinStyle")
-    icon_style = ET.SubElement(pin_style, "IconStyle")
-    ET.SubElement(icon_style, "scale").text = "1.0"
+    # Line style + pin style
+    parts.append(_style_block(color_kml))
 
     points = track_data["points"]
-    coords_str = " ".join(f"{lon},{lat},{alt}" for lat, lon, alt in points)
-
-    # Track placemark
-    pm = ET.SubElement(doc, "Placemark")
-    ET.SubElement(pm, "name").text = name
-    ET.SubElement(pm, "styleUrl").text = "#trackStyle"
-    ls = ET.SubElement(pm, "LineString")
-    ET.SubElement(ls, "altitudeMode").text = "absolute"
-    ET.SubElement(ls, "extrude").text = "0"
-    ET.SubElement(ls, "tessellate").text = "1"
-    ET.SubElement(ls, "coordinates").text = coords_str
+
+    # Track placemark. The coordinates are plain numbers, so they need no escaping and
+    # go out as their own chunk rather than being copied into a template string.
+    parts.append(
+        f"<Placemark><name>{name}</name><styleUrl>#trackStyle</styleUrl>"
+        "<LineString><altitudeMode>absolute</altitudeMode><extrude>0</extrude><tessellate>1</tessellate>"
+        "<coordinates>"
+    )
+    parts.append(format_coords(points))
+    parts.append("</coordinates></LineString></Placemark>")
 
     # Takeoff marker
     if points:
-        lat, lon, alt = points[0]
-        to = ET.SubElement(doc, "Placemark")
-        ET.SubElement(to, "name").text = "Takeoff"
-        ET.SubElement(to, "styleUrl").text = "#pinStyle"
-        pt = ET.SubElement(to, "Point")
-        ET.SubElement(pt, "altitudeMode").text = "absolute"
-        ET.SubElement(pt, "coordinates").text = f"{lon},{lat},{alt}"
+        parts.append(
+            "<Placemark><name>Takeoff</name><styleUrl>#pinStyle</styleUrl>"
+            f"<Point><altitudeMode>absolute</altitudeMode><coordinates>{format_coords(points[:1])}</coordinates>"
+            "</Point></Placemark>"
+        )
 
     # Landing marker
     if len(points) > 1:
-        lat, lon, alt = points[-1]
-        ld = ET.SubElement(doc, "Placemark")
-        ET.SubElement(ld, "name").text = "Landing"
-        ET.SubElement(ld, "styleUrl").text = "#pinStyle"
-        pt = ET.SubElement(ld, "Point")
-        ET.SubElement(pt, "altitudeMode").text = "absolute"
-        ET.SubElement(pt, "coordinates").text = f"{lon},{lat},{alt}"
+        parts.append(
+            "<Placemark><name>Landing</name><styleUrl>#pinStyle</styleUrl>"
+            f"<Point><altitudeMode>absolute</altitudeMode><coordinates>{format_coords(points[-1:])}</coordinates>"
+            "</Point></Placemark>"
+        )
 
-    return ET.ElementTree(kml)
+    parts.append("</Document></kml>")
+    return parts
 
 
-def write_kmz(kml_tree, output_path):
-    """Write a KML tree to a KMZ file (zipped KML)."""
-    kml_bytes = ET.tostring(kml_tree.getroot(), encoding="unicode", xml_declaration=False)
-    kml_bytes = '<?xml version="1.0" encoding="UTF-8"?>\n' + kml_bytes
+def write_kmz(kml, output_path, compresslevel=3, force_zip64=False):
+    """Write KML (text chunks, or a callable writing UTF-8 bytes to the entry) to a KMZ file."""
+    # zf.open() takes compression settings from the ZipInfo, not from the ZipFile
+    info = zipfile.ZipInfo("doc.kml", date_time=time.localtime()[:6])
+    info.compress_type = zipfile.ZIP_DEFLATED
+    if hasattr(info, "compress_level"):  # public since Python 3.13
+        info.compress_level = compresslevel
+    else:
+        info._compresslevel = compresslevel
 
-    with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as zf:
-        zf.writestr("doc.kml", kml_bytes)
+    # Write next to the target and rename on success, so a failure never leaves a
+    # truncated KMZ behind. The size of a streamed entry is unknown up front, so
+    # without force_zip64 an entry over 2 GiB makes the write fail with RuntimeError.
+    tmp_path = output_path + ".tmp"
+    try:
+        with zipfile.ZipFile(tmp_path, "w") as zf:
+            with zf.open(info, "w", force_zip64=force_zip64) as entry:
+                entry.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
+                if callable(kml):
+                    kml(entry)
+                else:
+                    for chunk in kml:
+                        entry.write(chunk.encode("utf-8"))
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 
 def convert_file(igc_path, color_kml, output_path=None, tolerance_m=0):
@@ -211,63 +269,93 @@ def convert_file(igc_path, color_kml, output_path=None, tolerance_m=0):
             return output_path, "No valid GPS fixes found"
         if tolerance_m > 0:
             data["points"] = simplify_track(data["points"], tolerance_m)
-        kml_tree = build_kml(data, name, color_kml)
-        write_kmz(kml_tree, output_path)
+        write_kmz(build_kml(data, name, color_kml), output_path)
         return output_path, None
     except Exception as e:
         return output_path, str(e)
 
 
-def pick_files_macos():
-    """Native macOS file picker via AppleScript."""
+def pick_options_macos():
+    """Run the up-front prompts (mode, source, color, compression) in one osascript call.
+
+    Returns a dict with "mode" ('files', 'folder' or 'merge') plus the answers that mode
+    asks for ("files", "hex_color", "folder", "compress"), or None if cancelled.
+    """
+    choose_folder = 'POSIX path of (choose folder with prompt "Select folder containing IGC subfolders")'
+    ask_compress = (
+        'button returned of (display dialog "Compress tracks?\\n\\n'
+        'This simplifies GPS tracklogs to reduce the number of points." '
+        'with title "Track Compression" '
+        'buttons {"Cancel", "Skip", "Compress Tracks"} '
+        'default button "Compress Tracks")'
+    )
+    # One answer per line: mode first, then the answers for that mode (file paths last)
     script = (
-        'set igcFiles to choose file of type {"igc", "IGC"} '
+        'set modeReply to button returned of (display dialog '
+        '"Convert individual IGC files, an entire folder, or merge existing KMZ files?" '
+        'with title "IGC to KMZ Converter" '
+        'buttons {"Select Files", "Select Folder", "Merge KMZ"} '
+        'default button "Select Files")\n'
+        'set answers to {}\n'
+        'if modeReply is "Merge KMZ" then\n'
+        '  set end of answers to "merge"\n'
+        f'  set end of answers to {choose_folder}\n'
+        f'  set end of answers to {ask_compress}\n'
+        'else if modeReply is "Select Folder" then\n'
+        '  set end of answers to "folder"\n'
+        f'  set end of answers to {choose_folder}\n'
+        'else\n'
+        '  set end of answers to "files"\n'
+        '  set igcFiles to choose file of type {"igc", "IGC"} '
         'with prompt "Select IGC files to convert" '
         'with multiple selections allowed\n'
-        'set posixPaths to {}\n'
-        'repeat with f in igcFiles\n'
-        '  set end of posixPaths to POSIX path of f\n'
-        'end repeat\n'
+        '  set chosenColor to choose color default color {65535, 0, 0}\n'
+        '  set end of answers to ((item 1 of chosenColor) as text) & "," & '
+        '((item 2 of chosenColor) as text) & "," & ((item 3 of chosenColor) as text)\n'
+        f'  set end of answers to {ask_compress}\n'
+        '  repeat with f in igcFiles\n'
+        '    set end of answers to POSIX path of f\n'
+        '  end repeat\n'
+        'end if\n'
         'set AppleScript\'s text item delimiters to linefeed\n'
-        'return posixPaths as text'
+        'return answers as text'
     )
     result = subprocess.run(["osascript", "-e", script], capture_output=True, text=True)
     if result.returncode != 0:
-        return []
-    return [p.strip() for p in result.stdout.strip().split("\n") if p.strip()]
+        return None
 
+    lines = result.stdout.strip().split("\n")
+    mode = lines[0]
+    if mode == "folder":
+        return {"mode": mode, "folder": lines[1].strip()}
+    if mode == "merge":
+        return {"mode": mode, "folder": lines[1].strip(), "compress": lines[2] == "Compress Tracks"}
 
-def pick_color_macos():
-    """Native macOS color picker via AppleScript. Returns '#RRGGBB' or None."""
-    script = 'choose color default color {65535, 0, 0}'
-    result = subprocess.run(["osascript", "-e", script], capture_output=True, text=True)
-    if result.returncode != 0:
-        return None
-    # Output: "65535, 0, 0"
-    parts = result.stdout.strip().split(",")
-    r = int(parts[0].strip()) // 256
-    g = int(parts[1].strip()) // 256
-    b = int(parts[2].strip()) // 256
-    return f"#{r:02x}{g:02x}{b:02x}"
+    # Color output: "65535,0,0"
+    r, g, b = (int(c.strip()) // 256 for c in lines[1].split(","))
+    return {
+        "mode": "files",
+        "hex_color": f"#{r:02x}{g:02x}{b:02x}",
+        "compress": lines[2] == "Compress Tracks",
+        "files": [p.strip() for p in lines[3:] if p.strip()],
+    }
 
 
-def pick_compress_macos():
-    """Ask user whether to compress tracks. Returns True, False, or None if cancelled."""
-    script = (
-        'display dialog "Compress tracks?\\n\\n'
-        'This simplifies GPS tracklogs to reduce the number of points." '
-        'with title "Track Compression" '
-        'buttons {"Cancel", "Skip", "Compress Tracks"} '
-        'default button "Compress Tracks"'
-    )
-    result = subprocess.run(["osascript", "-e", script], capture_output=True, text=True)
-    if result.returncode != 0:
-        return None
-    if "Compress Tracks" in result.stdout:
-        return True
-    if "Skip" in result.stdout:
-        return False
-    return None
+# doc.kml bytes read for the tolerance dialog, consumed by the merge that follows
+_inner_kml_cache = {}  # (path, st_mtime_ns, st_size) -> bytes
+
+
+def _load_inner_kml(kmz_path, keep=False):
+    """Return a KMZ's doc.kml bytes, popping a cached copy or, with keep=True, caching it."""
+    st = os.stat(kmz_path)
+    key = (kmz_path, st.st_mtime_ns, st.st_size)
+    data = _inner_kml_cache.pop(key, None)
+    if data is None:
+        with zipfile.ZipFile(kmz_path, "r") as zf:
+            data = zf.read("doc.kml")
+    if keep:
+        _inner_kml_cache[key] = data
+    return data
 
 
 def extract_points_from_kmz_folder(folder_path):
@@ -275,28 +363,12 @@ def extract_points_from_kmz_folder(folder_path):
     ns = "http://www.opengis.net/kml/2.2"
     all_points = []
 
-    for entry in sorted(os.listdir(folder_path)):
-        entry_path = os.path.join(folder_path, entry)
-        kmz_files = []
-        if os.path.isdir(entry_path):
-            kmz_files = [
-                os.path.join(entry_path, f)
-                for f in os.listdir(entry_path)
-                if f.lower().endswith(".kmz")
-            ]
-        elif entry.lower().endswith(".kmz"):
-            kmz_files = [entry_path]
-
+    for kmz_files in scan_groups(folder_path, (".kmz",)).values():
         for kmz_path in kmz_files:
             try:
-                with zipfile.ZipFile(kmz_path, "r") as zf:
-                    with zf.open("doc.kml") as kml_file:
-                        tree = ET.parse(kml_file)
-                root = tree.getroot()
-                doc = root.find(f"{{{ns}}}Document") or root.find("Document")
-                if doc is None:
-                    continue
-                for pm in doc.findall(f"{{{ns}}}Placemark"):
+                kml_file = io.BytesIO(_load_inner_kml(kmz_path, keep=True))
+                placemarks = list(_iter_document_children(kml_file, ("Placemark",)))
+                for pm in placemarks:
                     pm_name = pm.find(f"{{{ns}}}name")
                     if pm_name is not None and pm_name.text in ("Takeoff", "Landing"):
                         continue
@@ -389,34 +461,28 @@ def show_alert_macos(title, message):
     subprocess.run(["osascript", "-e", script], capture_output=True)
 
 
-def pick_mode_macos():
-    """Ask user to select files, a folder, or merge KMZ. Returns 'files', 'folder', or 'merge'."""
-    script = (
-        'display dialog "Convert individual IGC files, an entire folder, or merge existing KMZ files?" '
-        'with title "IGC to KMZ Converter" '
-        'buttons {"Select Files", "Select Folder", "Merge KMZ"} '
-        'default button "Select Files"'
-    )
-    result = subprocess.run(["osascript", "-e", script], capture_output=True, text=True)
-    if result.returncode != 0:
-        return None
-    if "Merge KMZ" in result.stdout:
-        return "merge"
-    if "Select Folder" in result.stdout:
-        return "folder"
-    return "files"
+def scan_groups(folder_path, exts, root_key=""):
+    """Group files ending in one of exts (lowercase) by immediate subfolder.
 
+    Returns {subfolder_name: sorted paths}; files directly inside folder_path are
+    listed under root_key. Subfolders without matching files are left out.
+    """
+    groups = {}
+    root_files = []
+    with os.scandir(folder_path) as it:
+        entries = sorted(it, key=attrgetter("name"))
+    for entry in entries:
+        if entry.is_dir():
+            with os.scandir(entry.path) as sub:
+                files = sorted(f.path for f in sub if f.name.lower().endswith(exts))
+            if files:
+                groups[entry.name] = files
+        elif entry.name.lower().endswith(exts):
+            root_files.append(entry.path)
 
-def pick_folder_macos():
-    """Native macOS folder picker via AppleScript. Returns POSIX path or None."""
-    script = (
-        'set chosenFolder to choose folder with prompt "Select folder containing IGC subfolders"\n'
-        'return POSIX path of chosenFolder'
-    )
-    result = subprocess.run(["osascript", "-e", script], capture_output=True, text=True)
-    if result.returncode != 0:
-        return None
-    return result.stdout.strip()
+    if root_files:
+        groups[root_key] = root_files
+    return groups
 
 
 def generate_colors(n):
@@ -439,23 +505,7 @@ def convert_folder(folder_path):
     output_root = os.path.join(parent_dir, folder_name + "_kmz")
 
     # Scan for subfolders with IGC files and root-level IGC files
-    groups = {}  # subfolder_name -> list of igc paths
-    root_files = []
-    for entry in sorted(os.listdir(folder_path)):
-        entry_path = os.path.join(folder_path, entry)
-        if os.path.isdir(entry_path):
-            igc_files = sorted(
-                os.path.join(entry_path, f)
-                for f in os.listdir(entry_path)
-                if f.lower().endswith(".igc")
-            )
-            if igc_files:
-                groups[entry] = igc_files
-        elif entry.lower().endswith(".igc"):
-            root_files.append(entry_path)
-
-    if root_files:
-        groups[""] = root_files  # empty string key = root level
+    groups = scan_groups(folder_path, (".igc",), root_key="")  # empty string key = root level
 
     if not groups:
         show_alert_macos("No Files Found", "No IGC files found in the selected folder or its subfolders.")
@@ -474,29 +524,42 @@ def convert_folder(folder_path):
     errors = []
     count = 0
 
-    for group_name in group_names:
-        igc_files = groups[group_name]
-        hex_color = color_map[group_name]
-        color_kml = rgb_hex_to_kml(hex_color)
-        display_name = group_name if group_name else "(root)"
-        print(f"\n--- {display_name} [{hex_color}] ---")
-
-        # Create output subfolder
-        out_dir = os.path.join(output_root, group_name) if group_name else output_root
-        os.makedirs(out_dir, exist_ok=True)
-
-        for igc_path in igc_files:
-            count += 1
-            basename = os.path.splitext(os.path.basename(igc_path))[0]
-            out_path = os.path.join(out_dir, basename + ".kmz")
-            print(f"[{count}/{total}] Converting {os.path.basename(igc_path)}...")
-            out, err = convert_file(igc_path, color_kml, output_path=out_path)
-            if err:
-                errors.append(f"{os.path.basename(igc_path)}: {err}")
-                print(f"  ERROR: {err}")
-            else:
-                success += 1
-                print(f"  -> {os.path.basename(out)}")
+    # Submit every file up front so workers stay busy across group boundaries
+    with ProcessPoolExecutor() as executor:
+        group_futures = {}  # group_name -> {future: igc_path}
+        for group_name in group_names:
+            color_kml = rgb_hex_to_kml(color_map[group_name])
+
+            # Create output subfolder
+            out_dir = os.path.join(output_root, group_name) if group_name else output_root
+            os.makedirs(out_dir, exist_ok=True)
+
+            futures = {}
+            for igc_path in groups[group_name]:
+                basename = os.path.splitext(os.path.basename(igc_path))[0]
+                out_path = os.path.join(out_dir, basename + ".kmz")
+                futures[executor.submit(convert_file, igc_path, color_kml, output_path=out_path)] = igc_path
+            group_futures[group_name] = futures
+
+        for group_name in group_names:
+            display_name = group_name if group_name else "(root)"
+            print(f"\n--- {display_name} [{color_map[group_name]}] ---")
+
+            futures = group_futures[group_name]
+            for future in as_completed(futures):
+                igc_path = futures[future]
+                count += 1
+                try:
+                    out, err = future.result()
+                except Exception as e:  # e.g. BrokenProcessPool if a worker died
+                    out, err = None, str(e) or type(e).__name__
+                print(f"[{count}/{total}] {os.path.basename(igc_path)}")
+                if err:
+                    errors.append(f"{os.path.basename(igc_path)}: {err}")
+                    print(f"  ERROR: {err}")
+                else:
+                    success += 1
+                    print(f"  -> {os.path.basename(out)}")
 
     # Summary
     msg = f"Converted {success}/{total} files successfully.\nOutput: {output_root}"
@@ -505,6 +568,35 @@ def convert_folder(folder_path):
     show_alert_macos("Conversion Complete", msg)
 
 
+def _iter_document_children(kml_file, tags):
+    """Parse a KML file, yielding direct children of <Document> whose local name is in tags.
+
+    Each child is detached from the Document as its end tag is parsed, so callers can
+    move it into another tree without the rest of the inner document coming along.
+    """
+    ns = "http://www.opengis.net/kml/2.2"
+    wanted = {f"{{{ns}}}{tag}" for tag in tags}
+    depth = 0
+    doc = None
+    # Coordinate blobs of long flights can exceed lxml's default 10 MB text node limit;
+    # never expand entities from third-party KMZs (expat doesn't load external ones either)
+    extra = {"huge_tree": True, "resolve_entities": False} if _HAVE_LXML else {}
+    for event, elem in ET.iterparse(kml_file, events=("start", "end"), **extra):
+        if event == "start":
+            depth += 1
+            # kml (depth 1) > Document (depth 2), with or without the KML namespace
+            if depth == 2 and elem.tag in (f"{{{ns}}}Document", "Document"):
+                doc = elem
+            continue
+        depth -= 1
+        if depth == 2 and doc is not None:
+            doc.remove(elem)
+            if elem.tag in wanted:
+                yield elem
+        elif depth == 1:
+            doc = None
+
+
 def merge_kmz_folder(folder_path, tolerance_m=0):
     """Merge all KMZ files in subfolders into a single combined KMZ."""
     folder_path = folder_path.rstrip("/")
@@ -514,37 +606,25 @@ def merge_kmz_folder(folder_path, tolerance_m=0):
     ns = "http://www.opengis.net/kml/2.2"
 
     # Scan for subfolders with KMZ files and root-level KMZ files
-    groups = {}  # subfolder_name -> list of kmz paths
-    root_files = []
-    for entry in sorted(os.listdir(folder_path)):
-        entry_path = os.path.join(folder_path, entry)
-        if os.path.isdir(entry_path):
-            kmz_files = sorted(
-                os.path.join(entry_path, f)
-                for f in os.listdir(entry_path)
-                if f.lower().endswith(".kmz")
-            )
-            if kmz_files:
-                groups[entry] = kmz_files
-        elif entry.lower().endswith(".kmz"):
-            root_files.append(entry_path)
-
-    if root_files:
-        groups["(root)"] = root_files
+    groups = scan_groups(folder_path, (".kmz",), root_key="(root)")
 
     if not groups:
         show_alert_macos("No Files Found", "No KMZ files found in the selected folder or its subfolders.")
         return
 
     # Build combined KML
-    kml = ET.Element("kml", xmlns=ns)
-    doc = ET.SubElement(kml, "Document")
-    ET.SubElement(doc, "name").text = folder_name
+    if _HAVE_LXML:
+        kml = ET.Element(f"{{{ns}}}kml", nsmap={None: ns})
+    else:
+        ET.register_namespace("", ns)
+        kml = ET.Element(f"{{{ns}}}kml")
+    doc = ET.SubElement(kml, f"{{{ns}}}Document")
+    ET.SubElement(doc, f"{{{ns}}}name").text = folder_name
 
     total_files = 0
     for group_name in sorted(groups.keys()):
-        folder_el = ET.SubElement(doc, "Folder")
-        ET.SubElement(folder_el, "name").text = group_name
+        folder_el = ET.SubElement(doc, f"{{{ns}}}Folder")
+        ET.SubElement(folder_el, f"{{{ns}}}name").text = group_name
 
         for kmz_path in groups[group_name]:
             total_files += 1
@@ -552,29 +632,22 @@ def merge_kmz_folder(folder_path, tolerance_m=0):
             print(f"  Adding {os.path.basename(kmz_path)}...")
 
             try:
-                with zipfile.ZipFile(kmz_path, "r") as zf:
-                    with zf.open("doc.kml") as kml_file:
-                        inner_tree = ET.parse(kml_file)
+                kml_file = io.BytesIO(_load_inner_kml(kmz_path))
+                children = list(_iter_document_children(kml_file, ("Style", "Placemark")))
             except Exception as e:
                 print(f"  ERROR reading {os.path.basename(kmz_path)}: {e}")
                 continue
 
-            inner_root = inner_tree.getroot()
-            # Find Document element (handle namespace)
-            inner_doc = inner_root.find(f"{{{ns}}}Document")
-            if inner_doc is None:
-                inner_doc = inner_root.find("Document")
-            if inner_doc is None:
-                continue
-
-            # Copy Style elements with prefixed IDs
-            for style in inner_doc.findall(f"{{{ns}}}Style"):
-                old_id = style.get("id", "")
-                style.set("id", file_prefix + old_id)
-                folder_el.append(style)
+            for child in children:
+                # Copy Style elements with prefixed IDs
+                if child.tag == f"{{{ns}}}Style":
+                    old_id = child.get("id", "")
+                    child.set("id", file_prefix + old_id)
+                    folder_el.append(child)
+                    continue
 
-            # Copy Placemarks with updated styleUrl references (skip Takeoff/Landing pins)
-            for pm in inner_doc.findall(f"{{{ns}}}Placemark"):
+                # Copy Placemarks with updated styleUrl references (skip Takeoff/Landing pins)
+                pm = child
                 pm_name = pm.find(f"{{{ns}}}name")
                 if pm_name is not None and pm_name.text in ("Takeoff", "Landing"):
                     continue
@@ -593,16 +666,27 @@ def merge_kmz_folder(folder_path, tolerance_m=0):
                             for triplet in coords_el.text.strip().split():
                                 parts = triplet.split(",")
                                 if len(parts) >= 3:
-                                    points.append((float(parts[1]), float(parts[0]), float(parts[2])))
+                                    # Round: _COORD_FMT's %d would truncate fractional altitudes
+                                    # from third-party KMZs (e.g. 812.9 -> 812)
+                                    points.append(
+                                        (float(parts[1]), float(parts[0]), round(float(parts[2])))
+                                    )
                             if len(points) > 2:
                                 simplified = simplify_track(points, tolerance_m)
-                                coords_el.text = " ".join(
-                                    f"{lon},{lat},{alt}" for lat, lon, alt in simplified
-                                )
+                                # Assign the fully formatted text once. Never build it up with
+                                # `coords_el.text += ...`: each += copies the whole string so far.
+                                coords_el.text = format_coords(simplified)
+
+    # Drop entries for files that changed or vanished between the two passes
+    _inner_kml_cache.clear()
 
     output_path = os.path.join(parent_dir, folder_name + "_merged.kmz")
-    kml_tree = ET.ElementTree(kml)
-    write_kmz(kml_tree, output_path)
+    write_kmz(
+        lambda f: ET.ElementTree(kml).write(f, encoding="utf-8", xml_declaration=False),
+        output_path,
+        compresslevel=6,
+        force_zip64=True,  # many long flights together can pass 2 GiB of KML
+    )
 
     msg = f"Merged {total_files} KMZ files into:\n{output_path}"
     print(f"\n{msg}")
@@ -610,46 +694,37 @@ def merge_kmz_folder(folder_path, tolerance_m=0):
 
 
 def main():
-    # Mode selection
-    mode = pick_mode_macos()
-    if mode is None:
+    # Mode, source and options, all asked up front
+    options = pick_options_macos()
+    if options is None:
         sys.exit(0)
+    mode = options["mode"]
 
     if mode == "merge":
-        folder = pick_folder_macos()
+        folder = options["folder"]
         if not folder:
             sys.exit(0)
-        compress = pick_compress_macos()
-        if compress is None:
-            sys.exit(0)
         tolerance = 0
-        if compress:
+        if options["compress"]:
             all_point_lists = extract_points_from_kmz_folder(folder)
             tolerance = pick_tolerance_macos(all_point_lists)
             if tolerance is None:
                 sys.exit(0)
         merge_kmz_folder(folder, tolerance_m=tolerance)
     elif mode == "folder":
-        folder = pick_folder_macos()
+        folder = options["folder"]
         if not folder:
             sys.exit(0)
         convert_folder(folder)
     else:
         # Existing file flow
-        files = pick_files_macos()
+        files = options["files"]
         if not files:
             sys.exit(0)
+        color_kml = rgb_hex_to_kml(options["hex_color"])
 
-        hex_color = pick_color_macos()
-        if hex_color is None:
-            sys.exit(0)
-        color_kml = rgb_hex_to_kml(hex_color)
-
-        compress = pick_compress_macos()
-        if compress is None:
-            sys.exit(0)
         tolerance = 0
-        if compress:
+        if options["compress"]:
             all_point_lists = [parse_igc(f)["points"] for f in files]
             tolerance = pick_tolerance_macos(all_point_lists)
             if tolerance is None:
@@ -657,15 +732,21 @@ def main():
 
         success = 0
         errors = []
-        for i, f in enumerate(files, 1):
-            print(f"[{i}/{len(files)}] Converting {os.path.basename(f)}...")
-            out, err = convert_file(f, color_kml, tolerance_m=tolerance)
-            if err:
-                errors.append(f"{os.path.basename(f)}: {err}")
-                print(f"  ERROR: {err}")
-            else:
-                success += 1
-                print(f"  -> {os.path.basename(out)}")
+        with ProcessPoolExecutor() as executor:
+            futures = {executor.submit(convert_file, f, color_kml, tolerance_m=tolerance): f for f in files}
+            for i, future in enumerate(as_completed(futures), 1):
+                f = futures[future]
+                try:
+                    out, err = future.result()
+                except Exception as e:  # e.g. BrokenProcessPool if a worker died
+                    out, err = None, str(e) or type(e).__name__
+                print(f"[{i}/{len(files)}] {os.path.basename(f)}")
+                if err:
+                    errors.append(f"{os.path.basename(f)}: {err}")
+                    print(f"  ERROR: {err}")
+                else:
+                    success += 1
+                    print(f"  -> {os.path.basename(out)}")
 
         msg = f"Converted {success}/{len(files)} files successfully."
         if errors: